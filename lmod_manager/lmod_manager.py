@@ -10,18 +10,28 @@ directory (e.g., /etc/lmod/modules/sparkpro or ~/.config/lmod/modulefiles/sparkp
 from __future__ import annotations
 
 import argparse
+import os
 import re
-import shutil
-import sys
-import textwrap
+import tarfile
+import tempfile
 from abc import abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property, lru_cache
 from importlib.metadata import version
 from pathlib import Path
-from subprocess import call
-from typing import Optional, Union
+from subprocess import run
+from typing import Any, ClassVar, Iterable, Optional, Sequence, Union
 
 DEFAULT_LMOD_MODULES_DIR = "/etc/lmod/modules"
 DEFAULT_INSTALLATION_DIR = "/opt"
+TAR_BUFFER_SIZE = 1024 * 1024
+
+LMOD_MODULEFILE_TEMPLATE = """\
+local pkgName = myModuleName()
+local version = myModuleVersion()
+local pkg     = pathJoin("{installation_dir}",pkgName,version,"bin")
+prepend_path("PATH", pkg)
+"""
 
 
 class Error(Exception):
@@ -29,111 +39,79 @@ class Error(Exception):
 
 
 class Tool:
-    def __init__(self, archive: Optional[Path] = None, module_name: Optional[str] = None) -> None:
-        assert (archive and not module_name) or (not archive and module_name)
-
-        if archive:
-            match = re.match(
-                rf"{self.archive_name()}-([\d.wrc]*(?:-\d*)?)"
-                rf"-([\w-]*)-(linux(?:64|)?)-bin\.tar\.gz",
-                archive.name,
-            )
-
-            if not match:
-                raise Error("unexpected archive name format")
-
-            self._archive = archive
-            self._version = match.group(1)
-            self._target = match.group(2)
-            self._linux = match.group(3)
-
-        if module_name:
-            match = re.match(rf"{self.name()}((?:-[^/]*)?)/([\d.wrc]*(?:-\d*)?)", module_name)
-
-            if not match:
-                raise Error("unexpected module name format")
-
-            self._target = match.group(1)[1:]
-            self._version = match.group(2)
+    NAME: ClassVar[str]
+    ARCHIVE_NAME: ClassVar[str]
+
+    def __init__(
+        self,
+        version: str,
+        target: str,
+        archive: Optional[Path] = None,
+        linux: Optional[str] = None,
+    ) -> None:
+        self._version = version
+        self._target = target
+        self._archive = archive
+        self._linux = linux
 
     @staticmethod
+    @lru_cache(maxsize=128)
     def from_archive(archive: Path) -> Tool:
-        if archive.name.startswith(GnatProRust.archive_name()):
-            return GnatProRust(archive)
-        if archive.name.startswith(Gnat.archive_name()):
-            return Gnat(archive)
-        if archive.name.startswith(Spark.archive_name()):
-            return Spark(archive)
-        if archive.name.startswith(CodePeer.archive_name()):
-            return CodePeer(archive)
-        if archive.name.startswith(GnatStudio.archive_name()):
-            return GnatStudio(archive)
-        if archive.name.startswith(Rust.archive_name()):
-            return Rust(archive)
-        raise Error("unexpected archive type")
+        match = _ARCHIVE_REGEX.match(archive.name)
+        archive_name = _longest_prefix(archive.name, _ARCHIVE_NAMES)
+
+        if not archive_name:
+            raise Error("unexpected archive type")
+        if not match or match.group(1) != archive_name:
+            raise Error("unexpected archive name format")
+
+        return _ARCHIVE_NAMES[match.group(1)](
+            match.group(2), match.group(3), archive, match.group(4)
+        )
 
     @staticmethod
+    @lru_cache(maxsize=128)
     def from_module(module_name: str) -> Tool:
-        if module_name.startswith(GnatProRust.name()):
-            return GnatProRust(module_name=module_name)
-        if module_name.startswith(Gnat.name()):
-            return Gnat(module_name=module_name)
-        if module_name.startswith(Spark.name()):
-            return Spark(module_name=module_name)
-        if module_name.startswith(CodePeer.name()):
-            return CodePeer(module_name=module_name)
-        if module_name.startswith(GnatStudio.name()):
-            return GnatStudio(module_name=module_name)
-        if module_name.startswith(Rust.name()):
-            return Rust(module_name=module_name)
-        raise Error("unexpected module type")
+        match = _MODULE_REGEX.match(module_name)
+        name = _longest_prefix(module_name, _NAMES)
 
-    @staticmethod
-    @abstractmethod
-    def name() -> str:
-        raise NotImplementedError
+        if not name:
+            raise Error("unexpected module type")
+        if not match or match.group(1) != name:
+            raise Error("unexpected module name format")
 
-    @staticmethod
-    @abstractmethod
-    def archive_name() -> str:
-        raise NotImplementedError
+        return _NAMES[match.group(1)](match.group(3), match.group(2)[1:])
 
-    @property
+    @cached_property
     def module_name(self) -> str:
         if self._target and self._target != "x86_64":
-            return f"{self.name()}-{self._target}"
-        return self.name()
+            return f"{self.NAME}-{self._target}"
+        return self.NAME
 
     def install(self, installation_dir: Path, lmod_modules_dir: Path) -> None:
-        full_installation_dir = self._installation_dir(installation_dir)
-        full_installation_dir.parent.mkdir(exist_ok=True)
-        config_dir = self._config_dir(lmod_modules_dir)
-        config_dir.mkdir(exist_ok=True)
+        full_installation_dir = self.installation_dir(installation_dir)
+        full_installation_dir.parent.mkdir(parents=True, exist_ok=True)
+        self._config_dir(lmod_modules_dir).mkdir(parents=True, exist_ok=True)
         config_file = self._config_file(lmod_modules_dir)
-        config_file.touch()
-
-        shutil.unpack_archive(self._archive, format="gztar")
-        self._install_archive(full_installation_dir)
-        shutil.rmtree(self._extracted_archive_dir())
-
-        with open(config_file, "w", encoding="utf-8") as f:
-            f.write(
-                textwrap.dedent(
-                    f"""\
-                    local pkgName = myModuleName()
-                    local version = myModuleVersion()
-                    local pkg     = pathJoin("{installation_dir}",pkgName,version,"bin")
-                    prepend_path("PATH", pkg)
-                    """
-                )
-            )
+
+        with tempfile.TemporaryDirectory(dir=".") as tmp_dir:
+            with tarfile.open(self._archive, mode="r|gz", bufsize=TAR_BUFFER_SIZE) as archive:
+                # The data filter is available in Python 3.12 and in security releases of
+                # older versions. Without it, the archive is extracted unfiltered as before.
+                archive.extraction_filter = getattr(tarfile, "data_filter", None)
+                archive.extractall(tmp_dir)
+            self._install_archive(self._extracted_archive_dir(Path(tmp_dir)), full_installation_dir)
+
+        config_file.write_text(
+            LMOD_MODULEFILE_TEMPLATE.format(installation_dir=installation_dir), encoding="utf-8"
+        )
 
     def uninstall(self, installation_dir: Path, lmod_modules_dir: Path) -> None:
-        installation_dir = self._installation_dir(installation_dir)
+        installation_dir = self.installation_dir(installation_dir)
 
-        if not installation_dir.exists():
-            raise Error(f"installation directory '{installation_dir}' not found")
         if not (installation_dir / self._installation_file()).exists():
+            if not installation_dir.exists():
+                raise Error(f"installation directory '{installation_dir}' not found")
             raise Error(f"directory '{installation_dir}' seems not to contain a valid installation")
 
         config_file = self._config_file(lmod_modules_dir)
@@ -141,20 +119,20 @@ class Tool:
         if not config_file.exists():
             raise Error(f"config file '{config_file}' not found")
 
-        shutil.rmtree(installation_dir)
+        run(["rm", "-rf", "--", str(installation_dir)], check=True)
         config_file.unlink()
 
     def _config_dir(self, prefix: Path) -> Path:
         return prefix / self.module_name
 
     def _config_file(self, prefix: Path) -> Path:
-        return prefix / self.module_name / f"{self._version}.lua"
+        return prefix.joinpath(self.module_name, f"{self._version}.lua")
 
-    def _installation_dir(self, prefix: Path) -> Path:
-        return prefix / self.module_name / self._version
+    def installation_dir(self, prefix: Path) -> Path:
+        return prefix.joinpath(self.module_name, self._version)
 
-    def _extracted_archive_dir(self) -> Path:
-        return Path(f"{self.archive_name()}-{self._version}-{self._target}-{self._linux}-bin")
+    def _extracted_archive_dir(self, prefix: Path) -> Path:
+        return prefix / f"{self.ARCHIVE_NAME}-{self._version}-{self._target}-{self._linux}-bin"
 
     @staticmethod
     @abstractmethod
@@ -162,131 +140,147 @@ class Tool:
         raise NotImplementedError
 
     @abstractmethod
-    def _install_archive(self, installation_dir: Path) -> None:
+    def _install_archive(self, extracted_archive_dir: Path, installation_dir: Path) -> None:
         raise NotImplementedError
 
 
 class Gnat(Tool):
-    @staticmethod
-    def name() -> str:
-        return "gnatpro"
-
-    @staticmethod
-    def archive_name() -> str:
-        return "gnatpro"
+    NAME = "gnatpro"
+    ARCHIVE_NAME = "gnatpro"
 
     @staticmethod
     def _installation_file() -> Path:
         return Path("bin/gnat")
 
-    def _install_archive(self, installation_dir: Path) -> None:
-        call(
-            f"cd {self._extracted_archive_dir()}"
-            f" && echo -e '\n{installation_dir}\nY\nY\n' | ./doinstall",
-            shell=True,
+    def _install_archive(self, extracted_archive_dir: Path, installation_dir: Path) -> None:
+        run(
+            ["./doinstall"],
+            cwd=extracted_archive_dir,
+            input=f"\n{installation_dir}\nY\nY\n",
+            text=True,
+            check=False,
         )
 
 
 class Spark(Tool):
-    @staticmethod
-    def name() -> str:
-        return "sparkpro"
-
-    @staticmethod
-    def archive_name() -> str:
-        return "spark-pro"
+    NAME = "sparkpro"
+    ARCHIVE_NAME = "spark-pro"
 
     @staticmethod
     def _installation_file() -> Path:
         return Path("bin/gnatprove")
 
-    def _install_archive(self, installation_dir: Path) -> None:
-        call(f"echo '{installation_dir}' | {self._extracted_archive_dir()}/doinstall", shell=True)
+    def _install_archive(self, extracted_archive_dir: Path, installation_dir: Path) -> None:
+        run(
+            [extracted_archive_dir / "doinstall"],
+            input=f"{installation_dir}\n",
+            text=True,
+            check=False,
+        )
 
 
 class CodePeer(Tool):
-    @staticmethod
-    def name() -> str:
-        return "codepeer"
-
-    @staticmethod
-    def archive_name() -> str:
-        return "codepeer"
+    NAME = "codepeer"
+    ARCHIVE_NAME = "codepeer"
 
     @staticmethod
     def _installation_file() -> Path:
         return Path("bin/codepeer")
 
-    def _install_archive(self, installation_dir: Path) -> None:
-        call(f"cd {self._extracted_archive_dir()} && ./doinstall {installation_dir}", shell=True)
+    def _install_archive(self, extracted_archive_dir: Path, installation_dir: Path) -> None:
+        run(["./doinstall", installation_dir], cwd=extracted_archive_dir, check=False)
 
 
 class GnatStudio(Tool):
-    @staticmethod
-    def name() -> str:
-        return "gnatstudio"
-
-    @staticmethod
-    def archive_name() -> str:
-        return "gnatstudio"
+    NAME = "gnatstudio"
+    ARCHIVE_NAME = "gnatstudio"
 
     @staticmethod
     def _installation_file() -> Path:
         return Path("bin/gnatstudio")
 
-    def _install_archive(self, installation_dir: Path) -> None:
-        call(f"cd {self._extracted_archive_dir()} && ./doinstall {installation_dir}", shell=True)
+    def _install_archive(self, extracted_archive_dir: Path, installation_dir: Path) -> None:
+        run(["./doinstall", installation_dir], cwd=extracted_archive_dir, check=False)
 
 
 class Rust(Tool):
-    @staticmethod
-    def name() -> str:
-        return "rust"
-
-    @staticmethod
-    def archive_name() -> str:
-        return "rust"
+    NAME = "rust"
+    ARCHIVE_NAME = "rust"
 
     @staticmethod
     def _installation_file() -> Path:
         return Path("bin/rustc")
 
-    def _install_archive(self, installation_dir: Path) -> None:
-        call(
-            f"./install --install-dir='{installation_dir}' --force",
-            cwd=self._extracted_archive_dir(),
-            shell=True,
+    def _install_archive(self, extracted_archive_dir: Path, installation_dir: Path) -> None:
+        run(
+            ["./install", f"--install-dir={installation_dir}", "--force"],
+            cwd=extracted_archive_dir,
+            check=False,
         )
 
 
 class GnatProRust(Tool):
-    @staticmethod
-    def name() -> str:
-        return "gnatpro-rust"
-
-    @staticmethod
-    def archive_name() -> str:
-        return "gnatpro-rust"
+    NAME = "gnatpro-rust"
+    ARCHIVE_NAME = "gnatpro-rust"
 
     @staticmethod
     def _installation_file() -> Path:
         return Path("bin/rustc")
 
-    def _install_archive(self, installation_dir: Path) -> None:
-        call(
-            f"./install --install-dir='{installation_dir}' --force",
-            cwd=self._extracted_archive_dir(),
-            shell=True,
+    def _install_archive(self, extracted_archive_dir: Path, installation_dir: Path) -> None:
+        run(
+            ["./install", f"--install-dir={installation_dir}", "--force"],
+            cwd=extracted_archive_dir,
+            check=False,
         )
 
 
-def main() -> Union[int, str]:
+_TOOLS: tuple[type[Tool], ...] = (Gnat, Spark, CodePeer, GnatStudio, Rust, GnatProRust)
+
+# Longer names must be matched first, as some names are prefixes of others (e.g., gnatpro and
+# gnatpro-rust).
+_ARCHIVE_NAMES = {t.ARCHIVE_NAME: t for t in sorted(_TOOLS, key=lambda t: -len(t.ARCHIVE_NAME))}
+_NAMES = {t.NAME: t for t in sorted(_TOOLS, key=lambda t: -len(t.NAME))}
+
+_ARCHIVE_REGEX = re.compile(
+    rf"({'|'.join(_ARCHIVE_NAMES)})-([\d.wrc]*(?:-\d*)?)-([\w-]*)-(linux(?:64|)?)-bin\.tar\.gz"
+)
+_MODULE_REGEX = re.compile(rf"({'|'.join(_NAMES)})((?:-[^/]*)?)/([\d.wrc]*(?:-\d*)?)")
+
+
+def _longest_prefix(name: str, prefixes: Iterable[str]) -> Optional[str]:
+    # The regex alternation falls back to a shorter alternative if a longer one fails to match, so
+    # the longest prefix is determined separately. The prefixes must be sorted by length.
+    return next((p for p in prefixes if name.startswith(p)), None)
+
+
+class VersionAction(argparse.Action):
+    def __init__(self, option_strings: Sequence[str], dest: str = argparse.SUPPRESS) -> None:
+        super().__init__(
+            option_strings=option_strings,
+            dest=dest,
+            default=argparse.SUPPRESS,
+            nargs=0,
+            help="show program's version number and exit",
+        )
+
+    def __call__(
+        self,
+        parser: argparse.ArgumentParser,
+        namespace: argparse.Namespace,
+        values: Union[str, Sequence[Any], None],
+        option_string: Optional[str] = None,
+    ) -> None:
+        print(version("lmod_manager"))
+        parser.exit()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> Union[int, str]:
     parser = argparse.ArgumentParser()
 
     parser.add_argument(
         "--version",
-        action="version",
-        version=version("lmod_manager"),
+        action=VersionAction,
     )
     parser.add_argument(
         "-l",
@@ -327,7 +321,7 @@ def main() -> Union[int, str]:
         help="list of modules (e.g., sparkpro/22.1)",
     )
 
-    args = parser.parse_args(sys.argv[1:])
+    args = parser.parse_args(argv)
 
     if not args.subcommand:
         parser.print_usage()
@@ -343,15 +337,37 @@ def main() -> Union[int, str]:
 
 
 def install(args: argparse.Namespace) -> Union[int, str]:
+    tools: dict[Path, tuple[Path, Tool]] = {}
+
     for archive in args.archives:
         if not archive.is_file():
             return f'file "{archive}" not found'
 
         try:
-            Tool.from_archive(archive).install(args.installation_dir, args.lmod_modules_dir)
+            tool = Tool.from_archive(archive)
         except Error as e:
             return str(e)
 
+        # Archives with the same installation directory must not be installed concurrently.
+        installation_dir = tool.installation_dir(args.installation_dir)
+        if installation_dir in tools:
+            other_archive, _ = tools[installation_dir]
+            if os.path.samefile(other_archive, archive):
+                continue
+            return (
+                f'archives "{other_archive}" and "{archive}" would both be installed'
+                f' into "{installation_dir}"'
+            )
+        tools[installation_dir] = (archive, tool)
+
+    with ThreadPoolExecutor(max_workers=min(len(tools), os.cpu_count() or 1)) as executor:
+        futures = [
+            executor.submit(tool.install, args.installation_dir, args.lmod_modules_dir)
+            for _, tool in tools.values()
+        ]
+        for future in futures:
+            future.result()
+
     return 0
 
 
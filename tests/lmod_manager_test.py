@@ -1,408 +1,311 @@
-import sys
+import os
+import shutil
 from collections.abc import Sequence
+from importlib.metadata import version
+from os.path import isfile
 from pathlib import Path
-from typing import NamedTuple
+from typing import List, NamedTuple, Set
 
 import pytest
-from pytest import MonkeyPatch
 
 from lmod_manager import main
 
 TEST_DATA = Path("tests/data")
+ARCHIVE_PATHS = {p.name: str(p) for p in TEST_DATA.glob("*.tar.gz")}
+
+
+class Archive(NamedTuple):
+    archive: str
+    name: str
+    version: str
+
+
+ARCHIVES = [
+    Archive(
+        "spark-pro-22.1-x86_64-linux-bin.tar.gz",
+        "sparkpro",
+        "22.1",
+    ),
+    Archive(
+        "spark-pro-23.0w-20220202-x86_64-linux-bin.tar.gz",
+        "sparkpro",
+        "23.0w-20220202",
+    ),
+    Archive(
+        "gnatpro-20.2-x86_64-linux-bin.tar.gz",
+        "gnatpro",
+        "20.2",
+    ),
+    Archive(
+        "gnatpro-22.2-x86_64-linux-bin.tar.gz",
+        "gnatpro",
+        "22.2",
+    ),
+    Archive(
+        "gnatpro-23.0w-20220202-x86_64-linux-bin.tar.gz",
+        "gnatpro",
+        "23.0w-20220202",
+    ),
+    Archive(
+        "gnatpro-23.0w-20220202-arm-elf-linux64-bin.tar.gz",
+        "gnatpro-arm-elf",
+        "23.0w-20220202",
+    ),
+    Archive(
+        "gnatpro-23.0w-20220202-riscv64-elf-linux64-bin.tar.gz",
+        "gnatpro-riscv64-elf",
+        "23.0w-20220202",
+    ),
+    Archive(
+        "codepeer-22.1-x86_64-linux-bin.tar.gz",
+        "codepeer",
+        "22.1",
+    ),
+    Archive(
+        "codepeer-23.0w-20220202-x86_64-linux-bin.tar.gz",
+        "codepeer",
+        "23.0w-20220202",
+    ),
+    Archive(
+        "gnatstudio-23.2-x86_64-linux-bin.tar.gz",
+        "gnatstudio",
+        "23.2",
+    ),
+    Archive(
+        "gnatpro-23.0w-20220202-aarch64-qnx-linux64-bin.tar.gz",
+        "gnatpro-aarch64-qnx",
+        "23.0w-20220202",
+    ),
+    Archive(
+        "gnatpro-24.1rc-20231020-aarch64-qnx-linux64-bin.tar.gz",
+        "gnatpro-aarch64-qnx",
+        "24.1rc-20231020",
+    ),
+    Archive(
+        "gnatpro-24.1rc-20231020-aarch64-elf-linux64-bin.tar.gz",
+        "gnatpro-aarch64-elf",
+        "24.1rc-20231020",
+    ),
+    Archive(
+        "gnatpro-24.1rc-20231020-x86_64-linux-bin.tar.gz",
+        "gnatpro",
+        "24.1rc-20231020",
+    ),
+    Archive(
+        "rust-25.0w-20240417-x86_64-linux-bin.tar.gz",
+        "rust",
+        "25.0w-20240417",
+    ),
+    Archive(
+        "gnatpro-rust-25.0w-20240820-x86_64-linux-bin.tar.gz",
+        "gnatpro-rust",
+        "25.0w-20240820",
+    ),
+]
+
+# The order matters, as "gnat" is also a prefix of "gnatstudio".
+INSTALLATION_FILES = (
+    ("gnatstudio", "bin/gnatstudio"),
+    ("gnat", "bin/gnat"),
+    ("spark", "bin/gnatprove"),
+    ("codepeer", "bin/codepeer"),
+    ("rust", "bin/rust"),
+)
+
+
+def _argv(lmod_dir: Path, installation_dir: Path, *args: str) -> List[str]:
+    return ["-l", str(lmod_dir), "-i", str(installation_dir), *args]
+
+
+def _installation_file(archive: Archive) -> str:
+    return next(f for prefix, f in INSTALLATION_FILES if archive.name.startswith(prefix))
+
+
+def _collect_paths(root: Path) -> Set[str]:
+    paths = set()
+    directories = [str(root)]
+
+    while directories:
+        with os.scandir(directories.pop()) as entries:
+            for entry in entries:
+                path = os.path.relpath(entry.path, root)
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append(entry.path)
+                    paths.add(f"{path}/")
+                else:
+                    paths.add(path)
 
-Archive = NamedTuple("Archive", [("archive", str), ("name", str), ("version", str)])
+    return paths
 
 
-def test_noarg(monkeypatch: MonkeyPatch) -> None:
-    monkeypatch.setattr(sys, "argv", [""])
-    assert main() == 2
+def test_noarg() -> None:
+    assert main([]) == 2
 
 
-def test_install_noarg(monkeypatch: MonkeyPatch) -> None:
-    monkeypatch.setattr(sys, "argv", ["", "install"])
+def test_version(capsys: pytest.CaptureFixture[str]) -> None:
     with pytest.raises(SystemExit):
-        main()
-
-
-def test_install_file_not_found(monkeypatch: MonkeyPatch, tmp_path: Path) -> None:
-    monkeypatch.setattr(
-        sys,
-        "argv",
-        [
-            "",
-            "-l",
-            str(tmp_path),
-            "-i",
-            str(tmp_path),
-            "install",
-            "foo",
-        ],
-    )
-    assert main() == 'file "foo" not found'
-
-
-def test_install_lmod_directory_not_found(monkeypatch: MonkeyPatch, tmp_path: Path) -> None:
-    directory = tmp_path / "lmod"
-    monkeypatch.setattr(
-        sys,
-        "argv",
-        [
-            "",
-            "-l",
-            str(directory),
-            "-i",
-            str(tmp_path),
-            "install",
-            str(TEST_DATA / "spark-pro-22.1-x86_64-linux-bin.tar.gz"),
-        ],
-    )
-    assert main() == f'directory "{directory}" not found'
-
-
-def test_install_installation_directory_not_found(monkeypatch: MonkeyPatch, tmp_path: Path) -> None:
-    directory = tmp_path / "install"
-    monkeypatch.setattr(
-        sys,
-        "argv",
-        [
-            "",
-            "-l",
-            str(tmp_path),
-            "-i",
-            str(directory),
-            "install",
-            str(TEST_DATA / "spark-pro-22.1-x86_64-linux-bin.tar.gz"),
-        ],
-    )
-    assert main() == f'directory "{directory}" not found'
-
-
-def test_install_unexpected_archive_type(monkeypatch: MonkeyPatch, tmp_path: Path) -> None:
-    archive = tmp_path / "foo-22.1-x86_64-linux-bin.tar.gz"
-    archive.touch()
-    monkeypatch.setattr(
-        sys,
-        "argv",
-        [
-            "",
-            "-l",
-            str(tmp_path),
-            "-i",
-            str(tmp_path),
+        main(["--version"])
+    assert capsys.readouterr().out == f"{version('lmod_manager')}\n"
+
+
+def test_install_noarg() -> None:
+    with pytest.raises(SystemExit):
+        main(["install"])
+
+
+@pytest.fixture(scope="class")
+def shared_tmp(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    return tmp_path_factory.mktemp("shared")
+
+
+class TestInstallErrors:
+    def test_install_file_not_found(self, shared_tmp: Path) -> None:
+        argv = _argv(shared_tmp, shared_tmp, "install", "foo")
+        assert main(argv) == 'file "foo" not found'
+
+    def test_install_lmod_directory_not_found(self, shared_tmp: Path) -> None:
+        directory = shared_tmp / "lmod"
+        argv = _argv(
+            directory,
+            shared_tmp,
             "install",
-            str(archive),
-        ],
-    )
-    assert main() == "unexpected archive type"
-
-
-def test_install_unexpected_archive_name_format(monkeypatch: MonkeyPatch, tmp_path: Path) -> None:
-    archive = tmp_path / "spark-pro-22.1.tar.gz"
-    archive.touch()
-    monkeypatch.setattr(
-        sys,
-        "argv",
-        [
-            "",
-            "-l",
-            str(tmp_path),
-            "-i",
-            str(tmp_path),
+            ARCHIVE_PATHS["spark-pro-22.1-x86_64-linux-bin.tar.gz"],
+        )
+        assert main(argv) == f'directory "{directory}" not found'
+
+    def test_install_installation_directory_not_found(self, shared_tmp: Path) -> None:
+        directory = shared_tmp / "install"
+        argv = _argv(
+            shared_tmp,
+            directory,
             "install",
-            str(archive),
-        ],
-    )
-    assert main() == "unexpected archive name format"
-
-
-@pytest.mark.parametrize(
-    "archives",
-    [
-        [
-            Archive(
-                "spark-pro-22.1-x86_64-linux-bin.tar.gz",
-                "sparkpro",
-                "22.1",
-            ),
-        ],
-        [
-            Archive(
-                "spark-pro-23.0w-20220202-x86_64-linux-bin.tar.gz",
-                "sparkpro",
-                "23.0w-20220202",
-            ),
-        ],
-        [
-            Archive(
-                "gnatpro-20.2-x86_64-linux-bin.tar.gz",
-                "gnatpro",
-                "20.2",
-            ),
-        ],
-        [
-            Archive(
-                "gnatpro-22.2-x86_64-linux-bin.tar.gz",
-                "gnatpro",
-                "22.2",
-            ),
-        ],
-        [
-            Archive(
-                "gnatpro-23.0w-20220202-x86_64-linux-bin.tar.gz",
-                "gnatpro",
-                "23.0w-20220202",
-            ),
-        ],
-        [
-            Archive(
-                "gnatpro-23.0w-20220202-arm-elf-linux64-bin.tar.gz",
-                "gnatpro-arm-elf",
-                "23.0w-20220202",
-            ),
-        ],
-        [
-            Archive(
-                "gnatpro-23.0w-20220202-riscv64-elf-linux64-bin.tar.gz",
-                "gnatpro-riscv64-elf",
-                "23.0w-20220202",
-            ),
-        ],
-        [
-            Archive(
-                "codepeer-22.1-x86_64-linux-bin.tar.gz",
-                "codepeer",
-                "22.1",
-            ),
-        ],
-        [
-            Archive(
-                "codepeer-23.0w-20220202-x86_64-linux-bin.tar.gz",
-                "codepeer",
-                "23.0w-20220202",
-            ),
-        ],
-        [
-            Archive(
-                "gnatstudio-23.2-x86_64-linux-bin.tar.gz",
-                "gnatstudio",
-                "23.2",
-            ),
-        ],
-        [
-            Archive(
-                "gnatpro-23.0w-20220202-aarch64-qnx-linux64-bin.tar.gz",
-                "gnatpro-aarch64-qnx",
-                "23.0w-20220202",
-            ),
-        ],
-        [
-            Archive(
-                "gnatpro-24.1rc-20231020-aarch64-qnx-linux64-bin.tar.gz",
-                "gnatpro-aarch64-qnx",
-                "24.1rc-20231020",
-            ),
-        ],
-        [
-            Archive(
-                "gnatpro-24.1rc-20231020-aarch64-elf-linux64-bin.tar.gz",
-                "gnatpro-aarch64-elf",
-                "24.1rc-20231020",
-            ),
-        ],
-        [
-            Archive(
-                "gnatpro-24.1rc-20231020-x86_64-linux-bin.tar.gz",
-                "gnatpro",
-                "24.1rc-20231020",
-            ),
-        ],
-        [
-            Archive(
-                "gnatpro-24.1rc-20231020-aarch64-qnx-linux64-bin.tar.gz",
-                "gnatpro-aarch64-qnx",
-                "24.1rc-20231020",
-            ),
-            Archive(
-                "gnatpro-24.1rc-20231020-aarch64-elf-linux64-bin.tar.gz",
-                "gnatpro-aarch64-elf",
-                "24.1rc-20231020",
-            ),
-            Archive(
-                "spark-pro-23.0w-20220202-x86_64-linux-bin.tar.gz",
-                "sparkpro",
-                "23.0w-20220202",
-            ),
-        ],
-        [
-            Archive(
-                "rust-25.0w-20240417-x86_64-linux-bin.tar.gz",
-                "rust",
-                "25.0w-20240417",
-            ),
-        ],
-        [
-            Archive(
-                "gnatpro-rust-25.0w-20240820-x86_64-linux-bin.tar.gz",
-                "gnatpro-rust",
-                "25.0w-20240820",
-            ),
-        ],
-    ],
-)
-def test_install_and_uninstall(
-    archives: Sequence[Archive], monkeypatch: MonkeyPatch, tmp_path: Path
-) -> None:
+            ARCHIVE_PATHS["spark-pro-22.1-x86_64-linux-bin.tar.gz"],
+        )
+        assert main(argv) == f'directory "{directory}" not found'
+
+    def test_install_unexpected_archive_type(self, shared_tmp: Path) -> None:
+        archive = shared_tmp / "foo-22.1-x86_64-linux-bin.tar.gz"
+        archive.touch()
+        argv = _argv(shared_tmp, shared_tmp, "install", str(archive))
+        assert main(argv) == "unexpected archive type"
+
+    def test_install_unexpected_archive_name_format(self, shared_tmp: Path) -> None:
+        archive = shared_tmp / "spark-pro-22.1.tar.gz"
+        archive.touch()
+        argv = _argv(shared_tmp, shared_tmp, "install", str(archive))
+        assert main(argv) == "unexpected archive name format"
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("archives", [ARCHIVES[:1], ARCHIVES], ids=["single", "all"])
+def test_install_and_uninstall(archives: Sequence[Archive], tmp_path: Path) -> None:
+    module_dirs = {f"{a.name}/" for a in archives}
+    lmod_files = {f"{a.name}/{a.version}.lua" for a in archives}
+    installation_dirs = {f"{a.name}/{a.version}/" for a in archives}
+    installation_files = {f"{a.name}/{a.version}/done" for a in archives}
+
     lmod_dir = tmp_path / "lmod"
     lmod_dir.mkdir()
-    lmod_files = {lmod_dir / a.name / f"{a.version}.lua" for a in archives}
     install_dir = tmp_path / "install"
     install_dir.mkdir()
-    monkeypatch.setattr(
-        sys,
-        "argv",
-        [
-            "",
-            "-l",
-            str(lmod_dir),
-            "-i",
-            str(install_dir),
-            "install",
-            *[str(TEST_DATA / a.archive) for a in archives],
-        ],
-    )
-    assert main() == 0
-    assert all(lmod_file.is_file() for lmod_file in lmod_files)
-    assert all((install_dir / a.name / a.version / "done").is_file() for a in archives)
+    argv = _argv(lmod_dir, install_dir, "install", *[ARCHIVE_PATHS[a.archive] for a in archives])
+    assert main(argv) == 0
+    assert lmod_files <= _collect_paths(lmod_dir)
+    assert installation_files <= _collect_paths(install_dir)
 
     for lmod_file in lmod_files:
-        lmod_file_lines = lmod_file.read_text().split("\n")
+        lmod_file_lines = (lmod_dir / lmod_file).read_text().splitlines()
 
         assert any(f'"{install_dir}"' in l for l in lmod_file_lines)
-
-        for l in lmod_file_lines:
-            assert not l.startswith(" ")
+        assert not any(l.startswith(" ") for l in lmod_file_lines)
 
     for archive in archives:
-        if archive.name.startswith("gnatstudio"):
-            file = "bin/gnatstudio"
-        elif archive.name.startswith("gnat"):
-            file = "bin/gnat"
-        elif archive.name.startswith("spark"):
-            file = "bin/gnatprove"
-        elif archive.name.startswith("codepeer"):
-            file = "bin/codepeer"
-        elif archive.name.startswith("rust"):
-            file = "bin/rust"
-        else:
-            assert False
-        (install_dir / archive.name / archive.version / file).mkdir(parents=True)
-
-    monkeypatch.setattr(
-        sys,
-        "argv",
-        [
-            "",
-            "-l",
-            str(lmod_dir),
-            "-i",
-            str(install_dir),
-            "uninstall",
-            *[f"{a.name}/{a.version}" for a in archives],
-        ],
-    )
-    assert main() == 0
-    assert all((lmod_dir / a.name).is_dir() for a in archives)
-    assert not all((lmod_dir / a.name / f"{a.version}.lua").is_file() for a in archives)
-    assert all((install_dir / a.name).is_dir() for a in archives)
-    assert not all((install_dir / a.name / a.version).exists() for a in archives)
-
-
-def test_uninstall_unexpected_module_type(monkeypatch: MonkeyPatch, tmp_path: Path) -> None:
-    monkeypatch.setattr(
-        sys,
-        "argv",
-        [
-            "",
-            "-l",
-            str(tmp_path),
-            "-i",
-            str(tmp_path),
-            "uninstall",
-            "invalid/1",
-        ],
-    )
-    assert main() == "unexpected module type"
-
-
-def test_uninstall_unexpected_module_name_format(monkeypatch: MonkeyPatch, tmp_path: Path) -> None:
-    monkeypatch.setattr(
-        sys,
-        "argv",
-        [
-            "",
-            "-l",
-            str(tmp_path),
-            "-i",
-            str(tmp_path),
-            "uninstall",
-            "sparkpro#invalid",
-        ],
-    )
-    assert main() == "unexpected module name format"
+        os.makedirs(
+            os.path.join(install_dir, archive.name, archive.version, _installation_file(archive))
+        )
 
+    argv = _argv(lmod_dir, install_dir, "uninstall", *[f"{a.name}/{a.version}" for a in archives])
+    assert main(argv) == 0
+    lmod_paths = _collect_paths(lmod_dir)
+    assert module_dirs <= lmod_paths
+    assert not lmod_files & lmod_paths
+    install_paths = _collect_paths(install_dir)
+    assert module_dirs <= install_paths
+    assert not installation_dirs & install_paths
 
-def test_uninstall_installation_directory_not_found(
-    monkeypatch: MonkeyPatch, tmp_path: Path
-) -> None:
-    monkeypatch.setattr(
-        sys,
-        "argv",
-        [
-            "",
-            "-l",
-            str(tmp_path),
-            "-i",
-            str(tmp_path),
-            "uninstall",
-            "sparkpro/12.3",
-        ],
-    )
-    assert main() == f"installation directory '{tmp_path}/sparkpro/12.3' not found"
-
-
-def test_uninstall_installation_directory_invalid(monkeypatch: MonkeyPatch, tmp_path: Path) -> None:
-    monkeypatch.setattr(
-        sys,
-        "argv",
-        [
-            "",
-            "-l",
-            str(tmp_path),
-            "-i",
-            str(tmp_path),
-            "uninstall",
-            "sparkpro/12.3",
-        ],
+
+def test_install_duplicate_archive(tmp_path: Path, capfd: pytest.CaptureFixture[str]) -> None:
+    lmod_dir = tmp_path / "lmod"
+    lmod_dir.mkdir()
+    install_dir = tmp_path / "install"
+    install_dir.mkdir()
+    archive = ARCHIVE_PATHS["spark-pro-22.1-x86_64-linux-bin.tar.gz"]
+    argv = _argv(lmod_dir, install_dir, "install", archive, str(Path(archive).absolute()))
+    assert main(argv) == 0
+    assert isfile(lmod_dir / "sparkpro" / "22.1.lua")
+    assert isfile(install_dir / "sparkpro" / "22.1" / "done")
+    assert capfd.readouterr().out.count("installation completed.") == 1
+
+
+def test_install_different_archives_with_same_installation_directory(tmp_path: Path) -> None:
+    lmod_dir = tmp_path / "lmod"
+    lmod_dir.mkdir()
+    install_dir = tmp_path / "install"
+    install_dir.mkdir()
+    archive = ARCHIVE_PATHS["spark-pro-22.1-x86_64-linux-bin.tar.gz"]
+    copy = tmp_path / Path(archive).name
+    shutil.copy(archive, copy)
+    argv = _argv(lmod_dir, install_dir, "install", archive, str(copy))
+    assert main(argv) == (
+        f'archives "{archive}" and "{copy}" would both be installed'
+        f' into "{install_dir}/sparkpro/22.1"'
     )
+    assert not (lmod_dir / "sparkpro").exists()
+    assert not (install_dir / "sparkpro").exists()
+
+
+def test_uninstall_unexpected_module_type(tmp_path: Path) -> None:
+    argv = _argv(tmp_path, tmp_path, "uninstall", "invalid/1")
+    assert main(argv) == "unexpected module type"
+
+
+def test_uninstall_unexpected_module_name_format(tmp_path: Path) -> None:
+    argv = _argv(tmp_path, tmp_path, "uninstall", "sparkpro#invalid")
+    assert main(argv) == "unexpected module name format"
+
+
+def test_uninstall_unexpected_module_name_format_of_longer_name(tmp_path: Path) -> None:
+    argv = _argv(tmp_path, tmp_path, "uninstall", "gnatpro-rustx/1")
+    assert main(argv) == "unexpected module name format"
+
+
+def test_uninstall_installation_directory_not_found(tmp_path: Path) -> None:
+    argv = _argv(tmp_path, tmp_path, "uninstall", "sparkpro/12.3")
+    assert main(argv) == f"installation directory '{tmp_path}/sparkpro/12.3' not found"
+
+
+def test_uninstall_installation_directory_invalid(tmp_path: Path) -> None:
+    argv = _argv(tmp_path, tmp_path, "uninstall", "sparkpro/12.3")
     (tmp_path / "sparkpro" / "12.3").mkdir(parents=True)
     assert (
-        main() == f"directory '{tmp_path}/sparkpro/12.3' seems not to contain a valid installation"
+        main(argv)
+        == f"directory '{tmp_path}/sparkpro/12.3' seems not to contain a valid installation"
     )
 
 
-def test_uninstall_config_file_not_found(monkeypatch: MonkeyPatch, tmp_path: Path) -> None:
-    monkeypatch.setattr(
-        sys,
-        "argv",
-        [
-            "",
-            "-l",
-            str(tmp_path),
-            "-i",
-            str(tmp_path),
-            "uninstall",
-            "sparkpro/12.3",
-        ],
-    )
+def test_uninstall_installation_dir_starting_with_dash(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "-x" / "sparkpro" / "12.3" / "bin" / "gnatprove").mkdir(parents=True)
+    (tmp_path / "lmod" / "sparkpro").mkdir(parents=True)
+    (tmp_path / "lmod" / "sparkpro" / "12.3.lua").touch()
+    assert main(["-l", "lmod", "-i-x", "uninstall", "sparkpro/12.3"]) == 0
+    assert not (tmp_path / "-x" / "sparkpro" / "12.3").exists()
+    assert not (tmp_path / "lmod" / "sparkpro" / "12.3.lua").exists()
+
+
+def test_uninstall_config_file_not_found(tmp_path: Path) -> None:
+    argv = _argv(tmp_path, tmp_path, "uninstall", "sparkpro/12.3")
     (tmp_path / "sparkpro" / "12.3" / "bin" / "gnatprove").mkdir(parents=True)
-    assert main() == f"config file '{tmp_path}/sparkpro/12.3.lua' not found"
+    assert main(argv) == f"config file '{tmp_path}/sparkpro/12.3.lua' not found"